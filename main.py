@@ -1,20 +1,38 @@
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
-import json
+import orjson
 import httpx
 import websockets # Used implicitly by FastAPI for WebSockets
-from datetime import datetime
+from time import time, localtime, strftime
 import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+import hmac
 import logging
+import os
 
 # --- Configuration & Setup ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Mobile Emulator Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background services are defined further down; shutdown runs in reverse start order,
+    # so the log broadcaster stops before the Redis connection it publishes to is closed
+    await connect_redis()
+    await open_http_client()
+    await start_log_broadcaster()
+    try:
+        yield
+    finally:
+        await stop_log_broadcaster()
+        await close_http_client()
+        await close_redis()
+
+app = FastAPI(title="Mobile Emulator Backend", lifespan=lifespan)
 
 # --- CORS ---
 # Allow all origins for simple demo purposes
@@ -28,7 +46,104 @@ app.add_middleware(
 
 # --- In-Memory User Store ---
 # NOTE: NEVER use this in production. Use a proper database.
-users_db: Dict[str, str] = {} # {username: password}
+class UserStore:
+    """Small wrapper around the {username: password} dict, so the backend can be swapped later."""
+    def __init__(self):
+        self._users: Dict[str, str] = {}
+
+    async def exists(self, username: str) -> bool:
+        return username in self._users
+
+    async def get(self, username: str) -> Optional[str]:
+        return self._users.get(username)
+
+    async def set(self, username: str, password: str):
+        self._users[username] = password
+
+    async def set_if_absent(self, username: str, password: str) -> bool:
+        """Stores the user unless the username is taken; returns whether it was stored."""
+        if username in self._users:
+            return False
+        self._users[username] = password
+        return True
+
+users_db = UserStore()
+
+# --- Optional Redis Backend ---
+# The in-memory store and WebSocket list only exist in one process. Setting REDIS_URL
+# (e.g. redis://localhost:6379) moves users to Redis and relays logs between workers over
+# pub/sub, so the app can run with `uvicorn --workers N` or on several hosts.
+REDIS_URL = os.getenv("REDIS_URL")
+LOG_CHANNEL = "logs"
+redis_client = None # redis.asyncio.Redis, only set when REDIS_URL is configured
+redis_logs_connected = False # True while this worker is subscribed to LOG_CHANNEL
+REDIS_RETRY_SECONDS = 5
+
+class RedisUserStore:
+    """User store shared by all workers, one `user:<username>` key per user."""
+    def __init__(self, client):
+        self._redis = client
+
+    async def exists(self, username: str) -> bool:
+        return await self._redis.exists(f"user:{username}") > 0
+
+    async def get(self, username: str) -> Optional[str]:
+        password = await self._redis.get(f"user:{username}")
+        return password.decode() if password is not None else None
+
+    async def set(self, username: str, password: str):
+        await self._redis.set(f"user:{username}", password)
+
+    async def set_if_absent(self, username: str, password: str) -> bool:
+        """Stores the user unless the username is taken; returns whether it was stored."""
+        # SET NX is atomic, so concurrent registrations on different workers can't both win
+        return bool(await self._redis.set(f"user:{username}", password, nx=True))
+
+async def forward_redis_logs():
+    """Relays log batches published by any worker to this worker's WebSocket clients.
+
+    Resubscribes after REDIS_RETRY_SECONDS if the Redis connection fails.
+    """
+    global redis_logs_connected
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(LOG_CHANNEL)
+            redis_logs_connected = True
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    manager.broadcast(message["data"])
+        except Exception as e:
+            logger.error(f"Redis log subscription failed, retrying in {REDIS_RETRY_SECONDS}s: {e}")
+        finally:
+            # Stop publishing while this worker can't relay logs to its clients
+            redis_logs_connected = False
+            try:
+                await pubsub.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing Redis log subscription: {e}")
+        await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+async def connect_redis():
+    global redis_client, users_db
+    if not REDIS_URL:
+        return
+    import redis.asyncio as aioredis # Optional dependency, only needed with REDIS_URL
+    redis_client = aioredis.from_url(REDIS_URL)
+    users_db = RedisUserStore(redis_client)
+    app.state.redis_forwarder = asyncio.create_task(forward_redis_logs())
+    logger.info(f"Using Redis at {REDIS_URL} for users and log broadcasts")
+
+async def close_redis():
+    if redis_client is None:
+        return
+    app.state.redis_forwarder.cancel()
+    try:
+        # Let the forwarder close its pubsub before the client goes away
+        await app.state.redis_forwarder
+    except asyncio.CancelledError:
+        pass
+    await redis_client.aclose()
 
 # --- Pydantic Models ---
 class UserCredentials(BaseModel):
@@ -42,61 +157,207 @@ class LLMPrompt(BaseModel):
     username: str
     prompt: str
 
+# Declared as response models so FastAPI (0.130+) serializes responses straight to JSON via pydantic-core
+class StatusMessage(BaseModel):
+    status: str
+    message: str
+
+class UserInfo(BaseModel):
+    username: str
+
 # --- WebSocket Connection Manager ---
+CONNECTION_QUEUE_MAXSIZE = 256 # Pending messages per client before the oldest are dropped
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Every client has its own bounded send queue drained by a writer task, so a slow
+        # client only delays (and eventually loses) its own messages and memory stays bounded
+        self.active_connections: Dict[WebSocket, asyncio.Queue] = {}
+        self._writers: Dict[WebSocket, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CONNECTION_QUEUE_MAXSIZE)
+        self.active_connections[websocket] = queue
+        self._writers[websocket] = asyncio.create_task(self._write(websocket, queue))
         logger.info(f"WebSocket connected: {websocket.client}")
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logger.info(f"WebSocket disconnected: {websocket.client}")
-
-    async def broadcast(self, message: str):
-        # Use asyncio.gather for concurrent sending
-        results = await asyncio.gather(
-            *[connection.send_text(message) for connection in self.active_connections],
-            return_exceptions=True # Don't let one failed send stop others
-        )
-        # Log any errors during broadcast
-        for result, connection in zip(results, self.active_connections):
-            if isinstance(result, Exception):
-                logger.error(f"Failed to send message to {connection.client}: {result}")
-                # Optionally disconnect clients that cause errors
-                # self.disconnect(connection)
+        if self.active_connections.pop(websocket, None) is None:
+            return  # Already removed, e.g. by its writer after a failed send
+        writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
+        logger.info(f"WebSocket disconnected: {websocket.client}")
+
+    async def _write(self, websocket: WebSocket, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await websocket.send(event)
+            except Exception as e:
+                logger.error(f"Failed to send message to {websocket.client}: {e}")
+                # Drop the dead connection so later broadcasts skip it
+                self.disconnect(websocket)
+                return
+
+    def broadcast(self, message: bytes):
+        if not self.active_connections:
+            return  # Nobody is listening, skip the fanout entirely
+        # Build the ASGI send event once and share it: send_bytes would allocate one per connection.
+        # The ASGI server only reads it, so every client gets the same payload object.
+        event = {"type": "websocket.send", "bytes": message}
+        for queue in self.active_connections.values():
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                queue.get_nowait() # Slow client: drop its oldest pending message
+                queue.put_nowait(event)
 
 
 manager = ConnectionManager()
 
 # --- Logging Utility ---
-async def log_and_broadcast(log_data: Dict[str, Any]):
-    """Adds timestamp and broadcasts log data via WebSocket."""
+# Broadcasts are decoupled from request handling: handlers only enqueue log data,
+# and a single background consumer pushes it to WebSocket clients.
+LOG_QUEUE_MAXSIZE = 1000
+log_queue: Optional[asyncio.Queue] = None # Holds lists of log entries
+
+# Log entries of the HTTP request being handled, flushed together by `batch_request_logs`
+log_buffer: "contextvars.ContextVar[Optional[List[Dict[str, Any]]]]" = contextvars.ContextVar("log_buffer", default=None)
+
+# Cache for the seconds part of the timestamp, which only changes once per second
+_ts_second = -1
+_ts_prefix = ""
+
+def iso_timestamp() -> str:
+    """Local-time ISO 8601 timestamp (same format as datetime.now().isoformat())."""
+    global _ts_second, _ts_prefix
+    now = time()
+    second = int(now)
+    if second != _ts_second:
+        _ts_second = second
+        _ts_prefix = strftime("%Y-%m-%dT%H:%M:%S", localtime(second))
+    return f"{_ts_prefix}.{int((now - second) * 1_000_000):06d}"
+
+def enqueue_logs(entries: List[Dict[str, Any]]):
+    """Queues log entries for broadcast via WebSocket without blocking."""
+    if not entries or log_queue is None:
+        return
     try:
-        log_data["timestamp"] = datetime.now().isoformat()
-        log_str = json.dumps(log_data) # No indentation for transmission efficiency
-        await manager.broadcast(log_str)
-        # Also log to server console
-        logger.info(f"Broadcasting Log: {log_str}")
-    except Exception as e:
-        logger.error(f"Error broadcasting log: {e}")
-
-# --- Helper to format log data ---
-def format_log(source: str, method: Optional[str] = None, url: Optional[str] = None,
-               status: Optional[int] = None, request_payload: Optional[Any] = None,
-               response_payload: Optional[Any] = None, detail: Optional[str] = None):
-    log_entry = {"source": source}
-    if method: log_entry["method"] = method
-    if url: log_entry["url"] = url
-    if status: log_entry["status"] = status
-    if request_payload: log_entry["request_payload"] = request_payload
-    if response_payload: log_entry["response_payload"] = response_payload
-    if detail: log_entry["detail"] = detail
-    return log_entry
+        log_queue.put_nowait(entries)
+    except asyncio.QueueFull:
+        logger.warning(f"Log queue full, dropping {len(entries)} log entries")
+
+def has_listeners() -> bool:
+    """Whether a log entry could reach any WebSocket client."""
+    # With Redis, clients may be connected to other workers, so publish while subscribed
+    return bool(manager.active_connections) or redis_logs_connected
+
+def log_and_broadcast(log_data: Dict[str, Any]):
+    """Adds timestamp and records log data for broadcast.
+
+    Inside an HTTP request the entry is buffered and sent with the rest of the
+    request's logs; otherwise it is queued right away.
+    """
+    if not has_listeners():
+        return  # No dashboards attached, skip timestamping and serialization
+    log_data["timestamp"] = iso_timestamp()
+    buffer = log_buffer.get()
+    if buffer is not None:
+        buffer.append(log_data)
+    else:
+        enqueue_logs([log_data])
+
+async def broadcast_logs():
+    """Drains the log queue and broadcasts queued entries to connected clients.
+
+    Everything already waiting in the queue is sent as one JSON array, so a burst of
+    log events costs a single serialization and a single send per connection.
+    """
+    while True:
+        batches = [await log_queue.get()]
+        while not log_queue.empty():
+            batches.append(log_queue.get_nowait())
+        batch = [entry for entries in batches for entry in entries]
+        try:
+            log_bytes = orjson.dumps(batch) # Compact UTF-8 bytes, sent as-is over the socket
+            if redis_logs_connected:
+                # Every worker (including this one) forwards it to its own clients
+                await redis_client.publish(LOG_CHANNEL, log_bytes)
+            else:
+                manager.broadcast(log_bytes)
+            # Also log to server console
+            logger.info(f"Broadcasting Log: {log_bytes.decode()}")
+        except Exception as e:
+            logger.error(f"Error broadcasting log: {e}")
+        finally:
+            for _ in batches:
+                log_queue.task_done()
+
+async def start_log_broadcaster():
+    global log_queue
+    # Created here so the queue is bound to the server's running event loop
+    log_queue = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+    app.state.log_broadcaster = asyncio.create_task(broadcast_logs())
+
+async def stop_log_broadcaster():
+    app.state.log_broadcaster.cancel()
+    try:
+        await app.state.log_broadcaster
+    except asyncio.CancelledError:
+        pass
+
+# --- Per-Request Log Batching ---
+class RequestLogBatchMiddleware:
+    """Collects all log entries of a request and broadcasts them once the response is sent.
+
+    Plain ASGI middleware: the request runs in the same task, and nothing is set up at
+    all while no dashboard is listening.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not has_listeners():
+            await self.app(scope, receive, send)
+            return
+        buffer: List[Dict[str, Any]] = []
+        token = log_buffer.set(buffer)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            log_buffer.reset(token)
+            enqueue_logs(buffer)
+
+app.add_middleware(RequestLogBatchMiddleware)
+
+def flush_request_logs():
+    """Queues the current request's buffered entries now, e.g. before a long streaming response."""
+    buffer = log_buffer.get()
+    if buffer:
+        enqueue_logs(buffer[:]) # Copy: the queued list must not change when the buffer is reused
+        buffer.clear()
+
+# --- Log Entry Templates ---
+# The static fields of every log entry are known per endpoint; handlers copy a template
+# with dict(template, **fields) and only add the dynamic parts.
+OLLAMA_URL = "http://localhost:11434/api/generate"
+
+_REGISTER_REQUEST_LOG = {"source": "client_request", "method": "POST", "url": "/register/"}
+_REGISTER_RESPONSE_LOG = {"source": "server_response", "method": "POST", "url": "/register/"}
+_LOGIN_REQUEST_LOG = {"source": "client_request", "method": "POST", "url": "/login/"}
+_LOGIN_RESPONSE_LOG = {"source": "server_response", "method": "POST", "url": "/login/"}
+_GET_USER_REQUEST_LOG = {"source": "client_request", "method": "GET"} # url depends on the username
+_GET_USER_RESPONSE_LOG = {"source": "server_response", "method": "GET"}
+_UPDATE_USER_REQUEST_LOG = {"source": "client_request", "method": "PUT"}
+_UPDATE_USER_RESPONSE_LOG = {"source": "server_response", "method": "PUT"}
+_LLM_REQUEST_LOG = {"source": "client_request", "method": "POST", "url": "/llm/generate"}
+_LLM_RESPONSE_LOG = {"source": "server_response", "method": "POST", "url": "/llm/generate"}
+_LLM_ERROR_LOG = {"source": "server_error", "method": "POST", "url": "/llm/generate"}
+_OLLAMA_REQUEST_LOG = {"source": "ollama_request", "method": "POST", "url": OLLAMA_URL}
+_OLLAMA_RESPONSE_LOG = {"source": "ollama_response", "url": OLLAMA_URL}
+_OLLAMA_ERROR_LOG = {"source": "ollama_error", "url": OLLAMA_URL}
 
 # --- WebSocket Endpoint ---
 @app.websocket("/ws/logs")
@@ -105,10 +366,12 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         # Keep the connection alive, listening for potential messages (though we don't process them here)
         while True:
-            # We don't expect messages FROM the client in this setup,
-            # but receive_text keeps the connection open and handles pings.
-            # If the client disconnects, it will raise WebSocketDisconnect.
-            await websocket.receive_text()
+            # We don't expect messages FROM the client in this setup, so read the raw ASGI
+            # event instead of receive_text(): nothing gets decoded, we only watch for the close.
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+        manager.disconnect(websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
@@ -117,210 +380,266 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 # --- Serve Frontend Files ---
-@app.get("/", response_class=HTMLResponse)
-async def serve_phonemulator_html():
+# The frontend never changes while the server runs, so read each file once at import
+# and reuse the same response object for every request.
+def _load_static(path: str) -> Optional[bytes]:
     try:
-        with open("phonemulator.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
+        with open(path, "rb") as f:
+            return f.read()
     except FileNotFoundError:
+        logger.warning(f"{path} not found, it will be served as 404")
+        return None
+
+_HTML_BYTES = _load_static("phonemulator.html")
+_CSS_BYTES = _load_static("style.css")
+_JS_BYTES = _load_static("script.js")
+
+_HTML_RESPONSE = HTMLResponse(content=_HTML_BYTES) if _HTML_BYTES is not None else None
+_CSS_RESPONSE = Response(content=_CSS_BYTES, media_type="text/css") if _CSS_BYTES is not None else None
+_JS_RESPONSE = Response(content=_JS_BYTES, media_type="application/javascript") if _JS_BYTES is not None else None
+
+@app.get("/", response_class=HTMLResponse)
+async def serve_phonemulator_html():
+    if _HTML_RESPONSE is None:
         raise HTTPException(status_code=404, detail="phonemulator.html not found")
+    return _HTML_RESPONSE
 
 @app.get("/style.css")
 async def serve_style_css():
-    try:
-        with open("style.css", "r", encoding="utf-8") as f:
-            return Response(content=f.read(), media_type="text/css")
-    except FileNotFoundError:
+    if _CSS_RESPONSE is None:
         raise HTTPException(status_code=404, detail="style.css not found")
+    return _CSS_RESPONSE
 
 @app.get("/script.js")
 async def serve_script_js():
-    try:
-        with open("script.js", "r", encoding="utf-8") as f:
-            return Response(content=f.read(), media_type="application/javascript")
-    except FileNotFoundError:
+    if _JS_RESPONSE is None:
         raise HTTPException(status_code=404, detail="script.js not found")
+    return _JS_RESPONSE
+
+
+# --- Shared HTTP Client ---
+# One pooled client for the app's lifetime keeps connections to Ollama alive between requests
+async def open_http_client():
+    app.state.http = httpx.AsyncClient(
+        timeout=60.0, # Increased timeout for LLM
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    )
+
+async def close_http_client():
+    await app.state.http.aclose()
+
+
+# --- Pre-serialized Error Responses ---
+# Error bodies are fixed, so encode them once at import and return the same response
+# objects instead of raising HTTPException (no traceback, no re-serialization).
+_USERNAME_TAKEN_PAYLOAD = {"detail": "Username already registered"}
+_INVALID_CREDENTIALS_PAYLOAD = {"detail": "Invalid username or password"}
+_USER_NOT_FOUND_PAYLOAD = {"detail": "User not found"}
+_NOT_AUTHENTICATED_PAYLOAD = {"detail": "User not found or not authenticated"}
+_LLM_UNAVAILABLE_PAYLOAD = {"detail": "LLM service unavailable"}
+_INTERNAL_ERROR_PAYLOAD = {"detail": "Internal server error"}
+_LLM_ERROR_PAYLOAD = {"detail": "Error from LLM service"}
+_USERNAME_TAKEN = JSONResponse(_USERNAME_TAKEN_PAYLOAD, status_code=400)
+_INVALID_CREDENTIALS = JSONResponse(_INVALID_CREDENTIALS_PAYLOAD, status_code=401)
+_USER_NOT_FOUND = JSONResponse(_USER_NOT_FOUND_PAYLOAD, status_code=404)
+_NOT_AUTHENTICATED = JSONResponse(_NOT_AUTHENTICATED_PAYLOAD, status_code=401)
+_LLM_UNAVAILABLE = JSONResponse(_LLM_UNAVAILABLE_PAYLOAD, status_code=503)
+_INTERNAL_ERROR = JSONResponse(_INTERNAL_ERROR_PAYLOAD, status_code=500)
+_LLM_ERROR = JSONResponse(_LLM_ERROR_PAYLOAD, status_code=502)
 
 
 # --- API Endpoints ---
 
-@app.post("/register/")
-async def register_user(user: UserCredentials, request: Request):
-    url_path = str(request.url.path)
-    await log_and_broadcast(format_log(
-        source="client_request", method="POST", url=url_path, request_payload=user.dict(exclude={'password'}) # Exclude pw from logs
-    ))
-
-    if user.username in users_db:
-        response_payload = {"detail": "Username already registered"}
-        await log_and_broadcast(format_log(
-            source="server_response", method="POST", url=url_path, status=400, response_payload=response_payload
-        ))
-        raise HTTPException(status_code=400, detail="Username already registered")
-
-    users_db[user.username] = user.password # Insecure: Store hashed passwords in real apps!
+@app.post("/register/", response_model=StatusMessage)
+async def register_user(user: UserCredentials):
+    log_and_broadcast(dict(_REGISTER_REQUEST_LOG, request_payload=user.model_dump(exclude={'password'}))) # Exclude pw from logs
+
+    # Check and store in one step so concurrent registrations can't overwrite each other
+    if not await users_db.set_if_absent(user.username, user.password): # Insecure: Store hashed passwords in real apps!
+        log_and_broadcast(dict(_REGISTER_RESPONSE_LOG, status=400, response_payload=_USERNAME_TAKEN_PAYLOAD))
+        return _USERNAME_TAKEN
+
     response_payload = {"status": "success", "message": f"User '{user.username}' registered"}
 
-    await log_and_broadcast(format_log(
-        source="server_response", method="POST", url=url_path, status=200, response_payload=response_payload
-    ))
+    log_and_broadcast(dict(_REGISTER_RESPONSE_LOG, status=200, response_payload=response_payload))
     return response_payload
 
-@app.post("/login/")
-async def login_user(user: UserCredentials, request: Request):
-    url_path = str(request.url.path)
-    await log_and_broadcast(format_log(
-        source="client_request", method="POST", url=url_path, request_payload=user.dict(exclude={'password'})
-    ))
-
-    stored_password = users_db.get(user.username)
-    # Insecure: Compare plain text passwords. Use password hashing (e.g., passlib) in real apps!
-    if not stored_password or stored_password != user.password:
-        response_payload = {"detail": "Invalid username or password"}
-        await log_and_broadcast(format_log(
-            source="server_response", method="POST", url=url_path, status=401, response_payload=response_payload
-        ))
-        raise HTTPException(status_code=401, detail="Invalid username or password")
+@app.post("/login/", response_model=StatusMessage)
+async def login_user(user: UserCredentials):
+    log_and_broadcast(dict(_LOGIN_REQUEST_LOG, request_payload=user.model_dump(exclude={'password'})))
+
+    stored_password = await users_db.get(user.username)
+    # Insecure: Compare plain text passwords. Use password hashing in real apps, e.g. passlib's
+    # CryptContext(schemes=["argon2"]) with tuned memory/time cost to keep login latency predictable.
+    # compare_digest takes the same time wherever the strings differ (bytes, so non-ASCII works too).
+    if not stored_password or not hmac.compare_digest(stored_password.encode(), user.password.encode()):
+        log_and_broadcast(dict(_LOGIN_RESPONSE_LOG, status=401, response_payload=_INVALID_CREDENTIALS_PAYLOAD))
+        return _INVALID_CREDENTIALS
 
     response_payload = {"status": "success", "message": f"User '{user.username}' logged in"}
-    await log_and_broadcast(format_log(
-        source="server_response", method="POST", url=url_path, status=200, response_payload=response_payload
-    ))
+    log_and_broadcast(dict(_LOGIN_RESPONSE_LOG, status=200, response_payload=response_payload))
     return response_payload
 
-@app.get("/user/{username}/")
-async def get_user_info(username: str, request: Request):
-    url_path = str(request.url.path)
-    await log_and_broadcast(format_log(
-        source="client_request", method="GET", url=url_path
-    ))
+@app.get("/user/{username}/", response_model=UserInfo)
+async def get_user_info(username: str):
+    url_path = f"/user/{username}/"
+    log_and_broadcast(dict(_GET_USER_REQUEST_LOG, url=url_path))
 
-    if username not in users_db:
-        response_payload = {"detail": "User not found"}
-        await log_and_broadcast(format_log(
-            source="server_response", method="GET", url=url_path, status=404, response_payload=response_payload
-        ))
-        raise HTTPException(status_code=404, detail="User not found")
+    if not await users_db.exists(username):
+        log_and_broadcast(dict(_GET_USER_RESPONSE_LOG, url=url_path, status=404, response_payload=_USER_NOT_FOUND_PAYLOAD))
+        return _USER_NOT_FOUND
 
     # Return only safe info
     response_payload = {"username": username}
-    await log_and_broadcast(format_log(
-        source="server_response", method="GET", url=url_path, status=200, response_payload=response_payload
-    ))
+    log_and_broadcast(dict(_GET_USER_RESPONSE_LOG, url=url_path, status=200, response_payload=response_payload))
     return response_payload
 
-@app.put("/user/{username}/")
-async def update_user_password(username: str, update_data: UserUpdate, request: Request):
-    url_path = str(request.url.path)
-    await log_and_broadcast(format_log(
-        source="client_request", method="PUT", url=url_path, request_payload={"username": username} # Don't log new pw
-    ))
-
-    if username not in users_db:
-        response_payload = {"detail": "User not found"}
-        await log_and_broadcast(format_log(
-            source="server_response", method="PUT", url=url_path, status=404, response_payload=response_payload
-        ))
-        raise HTTPException(status_code=404, detail="User not found")
-
-    users_db[username] = update_data.password # Update password (insecurely)
+@app.put("/user/{username}/", response_model=StatusMessage)
+async def update_user_password(username: str, update_data: UserUpdate):
+    url_path = f"/user/{username}/"
+    log_and_broadcast(dict(_UPDATE_USER_REQUEST_LOG, url=url_path, request_payload={"username": username})) # Don't log new pw
+
+    if not await users_db.exists(username):
+        log_and_broadcast(dict(_UPDATE_USER_RESPONSE_LOG, url=url_path, status=404, response_payload=_USER_NOT_FOUND_PAYLOAD))
+        return _USER_NOT_FOUND
+
+    await users_db.set(username, update_data.password) # Update password (insecurely)
     response_payload = {"status": "success", "message": f"Password for user '{username}' updated"}
-    await log_and_broadcast(format_log(
-        source="server_response", method="PUT", url=url_path, status=200, response_payload=response_payload
-    ))
+    log_and_broadcast(dict(_UPDATE_USER_RESPONSE_LOG, url=url_path, status=200, response_payload=response_payload))
     return response_payload
 
 @app.post("/llm/generate")
 async def generate_llm_response(payload: LLMPrompt, request: Request):
-    url_path = str(request.url.path)
-    client_request_payload = payload.dict()
-    await log_and_broadcast(format_log(
-        source="client_request", method="POST", url=url_path, request_payload=client_request_payload
-    ))
+    if has_listeners(): # Only dump the prompt if someone will see the log
+        log_and_broadcast(dict(_LLM_REQUEST_LOG, request_payload=payload.model_dump()))
 
     # --- Pseudo-Authentication Check ---
-    if payload.username not in users_db:
-        response_payload = {"detail": "User not found or not authenticated"}
-        await log_and_broadcast(format_log(
-            source="server_response", method="POST", url=url_path, status=401, response_payload=response_payload
-        ))
-        raise HTTPException(status_code=401, detail="User not found or not authenticated")
+    if not await users_db.exists(payload.username):
+        log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=401, response_payload=_NOT_AUTHENTICATED_PAYLOAD))
+        return _NOT_AUTHENTICATED
 
     # --- Call Ollama API ---
-    ollama_url = "http://localhost:11434/api/generate"
     ollama_payload = {
         "model": "llama2", # Or your desired model
         "prompt": payload.prompt,
-        "stream": False
+        "stream": True # Forward tokens as they are generated instead of waiting for the full completion
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client: # Increased timeout for LLM
+    client: httpx.AsyncClient = request.app.state.http
+    try:
+        # Log the outgoing request to Ollama
+        log_and_broadcast(dict(_OLLAMA_REQUEST_LOG, request_payload=ollama_payload))
+
+        response = await client.send(client.build_request("POST", OLLAMA_URL, json=ollama_payload), stream=True)
+    except httpx.RequestError as exc:
+        error_detail = f"Error requesting Ollama: {exc}"
+        logger.error(error_detail)
+        log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+        log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=503, response_payload=_LLM_UNAVAILABLE_PAYLOAD))
+        return _LLM_UNAVAILABLE
+    except Exception as e:
+         # Catch unexpected errors
+        error_detail = f"Unexpected error during LLM generation: {e}"
+        logger.exception(error_detail) # Log full traceback
+        log_and_broadcast(dict(_LLM_ERROR_LOG, detail=error_detail))
+        log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=500, response_payload=_INTERNAL_ERROR_PAYLOAD))
+        return _INTERNAL_ERROR
+
+    if response.is_error:
+        # Errors are not streamed, read the whole body so it can be logged
         try:
-            # Log the outgoing request to Ollama
-            await log_and_broadcast(format_log(
-                source="ollama_request", method="POST", url=ollama_url, request_payload=ollama_payload
-            ))
-
-            response = await client.post(ollama_url, json=ollama_payload)
-
-            # Log the response from Ollama
-            ollama_response_payload = None
-            try:
-                 # Try to parse JSON, but log raw if it fails
-                ollama_response_payload = response.json()
-            except json.JSONDecodeError:
-                 ollama_response_payload = {"raw_response": response.text}
-
-            await log_and_broadcast(format_log(
-                source="ollama_response", url=ollama_url, status=response.status_code, response_payload=ollama_response_payload
-            ))
-
-            response.raise_for_status() # Raise exception for 4xx/5xx errors
-
-            ollama_data = response.json()
-            generated_text = ollama_data.get("response", "Error: No 'response' field found in Ollama output.")
-
-            # Log the successful response being sent back to the client
-            final_response_payload = {"text": generated_text}
-            await log_and_broadcast(format_log(
-                source="server_response", method="POST", url=url_path, status=200, response_payload=final_response_payload
-            ))
-            return final_response_payload
-
+            await response.aread()
         except httpx.RequestError as exc:
-            error_detail = f"Error requesting Ollama: {exc}"
+            error_detail = f"Error reading Ollama error response: {exc}"
             logger.error(error_detail)
-            await log_and_broadcast(format_log(
-                source="ollama_error", url=ollama_url, detail=error_detail
-            ))
-            await log_and_broadcast(format_log(
-                source="server_response", method="POST", url=url_path, status=503, response_payload={"detail": "LLM service unavailable"}
-            ))
-            raise HTTPException(status_code=503, detail="LLM service unavailable")
-        except httpx.HTTPStatusError as exc:
-            error_detail = f"Ollama returned error: {exc.response.status_code} - {exc.response.text}"
-            logger.error(error_detail)
-            # Already logged the Ollama response, just log the server response error
-            await log_and_broadcast(format_log(
-                source="server_response", method="POST", url=url_path, status=502, response_payload={"detail": "Error from LLM service"}
-            ))
-            raise HTTPException(status_code=502, detail="Error from LLM service")
-        except Exception as e:
-             # Catch unexpected errors
-            error_detail = f"Unexpected error during LLM generation: {e}"
-            logger.exception(error_detail) # Log full traceback
-            await log_and_broadcast(format_log(
-                source="server_error", method="POST", url=url_path, detail=error_detail
-            ))
-            await log_and_broadcast(format_log(
-                source="server_response", method="POST", url=url_path, status=500, response_payload={"detail": "Internal server error"}
-            ))
-            raise HTTPException(status_code=500, detail="Internal server error")
+            log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+            log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=503, response_payload=_LLM_UNAVAILABLE_PAYLOAD))
+            return _LLM_UNAVAILABLE
+        finally:
+            await response.aclose()
+        try:
+             # Parse the body once and reuse it for the log entry; log raw text if it isn't JSON
+            ollama_response_payload = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+             ollama_response_payload = {"raw_response": response.text}
+        log_and_broadcast(dict(_OLLAMA_RESPONSE_LOG, status=response.status_code, response_payload=ollama_response_payload))
+        logger.error(f"Ollama returned error: {response.status_code} - {response.text}")
+        log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=502, response_payload=_LLM_ERROR_PAYLOAD))
+        return _LLM_ERROR
+
+    # Let the dashboard see the request and the Ollama call while the generation runs
+    flush_request_logs()
+    return StreamingResponse(
+        stream_ollama_response(response),
+        media_type="text/plain; charset=utf-8",
+    )
+
+NO_RESPONSE_TEXT = "Error: No 'response' field found in Ollama output."
+
+def _log_cut_short(tokens: List[str]):
+    """Logs the closing server response of a stream that ended before Ollama finished."""
+    log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=200, response_payload={"text": "".join(tokens), **_LLM_ERROR_PAYLOAD}))
+
+async def stream_ollama_response(response: httpx.Response):
+    """Yields generated tokens from Ollama's JSON-lines stream and logs the completed response."""
+    tokens: List[str] = []
+    # The 200 status has already been sent, so every failure below can only cut the stream
+    # short; each path still logs a closing server_response with what was generated so far
+    try:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            try:
+                chunk = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                error_detail = f"Skipping malformed line in Ollama stream: {line!r}"
+                logger.warning(error_detail)
+                log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+                continue
+            if chunk.get("error"):
+                # Ollama reports failures mid-stream as an error line
+                error_detail = f"Ollama returned error while streaming: {chunk['error']}"
+                logger.error(error_detail)
+                log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+                _log_cut_short(tokens)
+                return
+            token = chunk.get("response")
+            if token:
+                tokens.append(token)
+                yield token
+            if chunk.get("done"):
+                if not tokens:
+                    tokens.append(NO_RESPONSE_TEXT)
+                    yield NO_RESPONSE_TEXT
+                # The final chunk carries the generation stats; log it with the full text
+                chunk["response"] = generated_text = "".join(tokens)
+                log_and_broadcast(dict(_OLLAMA_RESPONSE_LOG, status=response.status_code, response_payload=chunk))
+                log_and_broadcast(dict(_LLM_RESPONSE_LOG, status=200, response_payload={"text": generated_text}))
+                return
+        # The stream closed without a final "done" chunk, so the text may be incomplete
+        error_detail = "Ollama stream ended without a final 'done' chunk"
+        logger.error(error_detail)
+        log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+        _log_cut_short(tokens)
+    except httpx.RequestError as exc:
+        error_detail = f"Error reading Ollama stream: {exc}"
+        logger.error(error_detail)
+        log_and_broadcast(dict(_OLLAMA_ERROR_LOG, detail=error_detail))
+        _log_cut_short(tokens)
+    except Exception as e:
+        error_detail = f"Unexpected error while streaming LLM response: {e}"
+        logger.exception(error_detail) # Log full traceback
+        log_and_broadcast(dict(_LLM_ERROR_LOG, detail=error_detail))
+        _log_cut_short(tokens)
+    finally:
+        await response.aclose()
 
 # --- Run Instruction (if running directly) ---
 if __name__ == "__main__":
+    import sys
     import uvicorn
     # Make sure Ollama server is running (e.g., `ollama serve`)
     print("Ensure the Ollama server is running on http://localhost:11434")
     print("Starting FastAPI server on http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop has much lower per-callback overhead than the default asyncio loop (not available on Windows)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="asyncio" if sys.platform == "win32" else "uvloop")
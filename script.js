@@ -4,6 +4,7 @@ const WS_URL = 'ws://localhost:8000/ws/logs'; // Your WebSocket endpoint
 // --- State ---
 let currentUsername = null; // Keep track of logged-in user
 let ws = null; // WebSocket connection object
+const textDecoder = new TextDecoder(); // Logs arrive as binary (UTF-8 JSON) frames
 
 // --- DOM Elements ---
 const usernameInput = document.getElementById('username');
@@ -193,9 +194,29 @@ async function sendLLMPrompt() {
     displayUserResponse("Sending prompt to LLM..."); // Indicate loading
 
     try {
-        const data = await makeApiRequest('/llm/generate', 'POST', { username: currentUsername, prompt });
-        // Display LLM response clearly
-        userResponseArea.innerHTML = `<p><strong>LLM Response:</strong></p><p>${escapeHtml(data.text)}</p>`;
+        // The backend streams the generated text as plain text, so read it chunk by chunk
+        const response = await fetch(`${API_BASE_URL}/llm/generate`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username: currentUsername, prompt }),
+        });
+        if (!response.ok) {
+            // Errors are still returned as JSON with a `detail` field
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.detail || response.statusText || `HTTP error ${response.status}`);
+        }
+
+        // Display LLM response clearly, growing as tokens arrive
+        userResponseArea.innerHTML = '<p><strong>LLM Response:</strong></p><p></p>';
+        const responseText = userResponseArea.lastElementChild;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            responseText.textContent += decoder.decode(value, { stream: true });
+        }
+        responseText.textContent += decoder.decode();
         // llmPromptInput.value = ''; // Optional: Clear prompt after sending
     } catch (error) {
         displayUserResponse(`LLM Error: ${error.message}`, true);
@@ -211,6 +232,7 @@ function setupWebSocket() {
     }
 
     ws = new WebSocket(WS_URL);
+    ws.binaryType = 'arraybuffer';
     appendLog({ system: 'Attempting WebSocket connection...' }); // Use object format
 
     ws.onopen = () => {
@@ -220,8 +242,10 @@ function setupWebSocket() {
 
     ws.onmessage = (event) => {
         try {
-            const logData = JSON.parse(event.data);
-            appendLog(logData);
+            const text = typeof event.data === 'string' ? event.data : textDecoder.decode(event.data);
+            const logData = JSON.parse(text);
+            // The server batches log entries that were queued together into one array
+            (Array.isArray(logData) ? logData : [logData]).forEach(appendLog);
         } catch (error) {
             console.error('Failed to parse WebSocket message:', event.data, error);
             appendLog({ system: 'Received non-JSON WebSocket message', data: event.data });